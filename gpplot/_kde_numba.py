@@ -0,0 +1,16 @@
+"""Numba kernel for direct evaluation of 1D gaussian kernel density estimates. Requires numba."""
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _kde_eval(samples, grid, h, out):
+    """Evaluate the gaussian kde of samples with bandwidth h at each grid point, storing the result in out"""
+    norm = 1 / (len(samples) * h * np.sqrt(2 * np.pi))
+    for i in prange(len(grid)):
+        total = 0.0
+        for j in range(len(samples)):
+            z = (grid[i] - samples[j]) / h
+            total += np.exp(-0.5 * z * z)
+        out[i] = total * norm
@@ -0,0 +1,31 @@
+"""Deferred imports of slow to import dependencies, so that importing gpplot does not set up a matplotlib backend"""
+
+from functools import lru_cache
+
+
+def pyplot():
+    """matplotlib.pyplot"""
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def seaborn():
+    """seaborn"""
+    import seaborn as sns
+    return sns
+
+
+def adjust_text():
+    """adjustText.adjust_text"""
+    from adjustText import adjust_text
+    return adjust_text
+
+
+@lru_cache(maxsize=None)
+def kde_eval():
+    """Numba kde kernel from gpplot._kde_numba, or None if numba is not installed"""
+    try:
+        from ._kde_numba import _kde_eval
+    except ImportError:
+        return None
+    return _kde_eval
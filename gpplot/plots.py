@@ -1,24 +1,135 @@
 """Plots module - contains functions to generate plots."""
 
-import seaborn as sns
-import matplotlib.pyplot as plt
+from functools import lru_cache
+
+import matplotlib as mpl
 import numpy as np
-from scipy.interpolate import interpn
 from scipy import stats
+from matplotlib import cm, colors, ticker
 from matplotlib.offsetbox import AnchoredText
-from matplotlib import ticker
-from adjustText import adjust_text
 
+from . import _lazy
+
+# Largest number of sample x grid point pairs for which the numba kernel is faster than _fft_kde
+_NUMBA_KDE_MAX_SIZE = 2 ** 13
+
+
+def _kde_grid(samples, grid_n, bw):
+    """Drop non-finite values from samples and get the kde bandwidth and the edges of a regular grid of grid_n
+    bins extending 3 bandwidths past the data. If no samples remain, the edges are empty"""
+    samples = np.asarray(samples, dtype=float)
+    samples = samples[np.isfinite(samples)]
+    if len(samples) == 0:
+        return samples, 0.0, np.empty(0)
+    if bw == 'scott':
+        bw = len(samples) ** (-1 / 5)
+    h = bw * samples.std()
+    # The padding also keeps the circular convolution in _fft_kde from wrapping
+    pad = 3 * h if h > 0 else 0.5
+    edges = np.linspace(samples.min() - pad, samples.max() + pad, grid_n + 1)
+    return samples, h, edges
+
+
+def _fft_kde(samples, grid_n=512, bw='scott'):
+    """Gaussian kernel density estimate of 1D samples, computed by binning the samples on a regular grid
+    and convolving the bin counts with the kernel in Fourier space
+
+    Parameters
+    ----------
+    samples: array-like
+        Values to estimate the density of, non-finite values are dropped
+    grid_n: int, optional
+        Number of grid points to evaluate the density at
+    bw: str or float, optional
+        'scott' or a scalar factor, which is multiplied by the standard deviation of samples to get the bandwidth
+
+    Returns
+    -------
+    tuple:
+        (grid, density), which are empty if there are no finite samples
+    """
+    samples, h, edges = _kde_grid(samples, grid_n, bw)
+    if len(samples) == 0:
+        return np.empty(0), np.empty(0)
+    counts, _ = np.histogram(samples, bins=edges)
+    dx = edges[1] - edges[0]
+    freqs = np.arange(grid_n // 2 + 1) / (grid_n * dx)
+    kernel = np.exp(-0.5 * (2 * np.pi * freqs * h) ** 2)
+    density = np.fft.irfft(np.fft.rfft(counts) * kernel, n=grid_n) / (len(samples) * dx)
+    grid = 0.5 * (edges[1:] + edges[:-1])
+    return grid, np.clip(density, 0, None)
+
+
+def _kde(samples, grid_n=512, bw='scott', use_numba=False):
+    """Gaussian kernel density estimate of 1D samples
+
+    Evaluated with _fft_kde, unless use_numba is True, numba is installed and the input is small enough for
+    the parallel numba kernel to be faster.
+    Otherwise takes the same parameters and returns the same (grid, density) tuple as _fft_kde. Results are cached by
+    the values of samples, so the returned arrays are read-only.
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.float64)
+    return _cached_kde(samples.tobytes(), grid_n, bw, use_numba)
+
+
+@lru_cache(maxsize=32)
+def _cached_kde(samples_bytes, grid_n, bw, use_numba):
+    """_kde of samples stored as float64 bytes, which can be hashed for the cache"""
+    samples, h, edges = _kde_grid(np.frombuffer(samples_bytes, dtype=np.float64), grid_n, bw)
+    grid = 0.5 * (edges[1:] + edges[:-1])
+    size = len(samples) * grid_n
+    # Only load numba when the kernel would be used, since importing and compiling it is slow
+    _kde_eval = _lazy.kde_eval() if use_numba and size <= _NUMBA_KDE_MAX_SIZE else None
+    if h == 0 or _kde_eval is None:
+        grid, density = _fft_kde(samples, grid_n=grid_n, bw=bw)
+    else:
+        density = np.empty(grid_n)
+        _kde_eval(samples, grid, h, density)
+    grid.flags.writeable = False
+    density.flags.writeable = False
+    return grid, density
+
+
+def _bin_indices(values, n):
+    """Edges of n equal width bins spanning values, as in np.histogram, and the bin index of each value"""
+    if len(values) == 0:
+        lo, hi = 0, 1
+    else:
+        lo, hi = values.min(), values.max()
+    if not (np.isfinite(lo) and np.isfinite(hi)):
+        raise ValueError('autodetected range of [{}, {}] is not finite'.format(lo, hi))
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    edges = np.linspace(lo, hi, n + 1)
+    return edges, np.clip(np.searchsorted(edges, values, side='right') - 1, 0, n - 1)
+
+
+def _histogram2d(x_val, y_val, bins):
+    """2D histogram of counts, equivalent to np.histogram2d with integer bins, which also returns the bin
+    indices of each point
 
-def label_axes(x, color, label, text_xpos, text_ypos, text_ha, text_va):
-    """For use with ridgeplot, define and use a simple function
-    to label the kde plots in axes coordinates"""
+    Returns
+    -------
+    tuple:
+        (histogram, x edges, y edges, x bin indices, y bin indices)
+    """
+    x_e, ix = _bin_indices(x_val, bins[0])
+    y_e, iy = _bin_indices(y_val, bins[1])
+    hist = np.bincount(ix * bins[1] + iy, minlength=bins[0] * bins[1]).reshape(bins)
+    return hist, x_e, y_e, ix, iy
+
+
+def ridge_kde(x, color, label, alpha, lw, clip_on=False, use_numba=False):
+    """For use with ridgeplot, draw a filled kde of x on the current axis"""
+    plt = _lazy.pyplot()
     ax = plt.gca()
-    ax.text(text_xpos, text_ypos, label, color=color, ha=text_ha, va=text_va, transform=ax.transAxes)
+    grid, density = _kde(x, use_numba=use_numba)
+    ax.fill_between(grid, density, color=color, alpha=alpha, lw=0, clip_on=clip_on)
+    ax.plot(grid, density, color=color, lw=lw, clip_on=clip_on, label=label)
 
 
 def ridgeplot(data, x, hue, aspect=5, height=1, alpha=0.7, text_xpos=0, text_ypos=0.2, text_ha='left', text_va='center',
-              lw=0.5, **kwargs):
+              lw=0.5, use_numba=False, **kwargs):
     """
     Creates a ridgeplot of overlapping kde plots
 
@@ -46,6 +157,9 @@ def ridgeplot(data, x, hue, aspect=5, height=1, alpha=0.7, text_xpos=0, text_ypo
         Specify the vertical alignment of text labels
     lw : float, optional
         Specifies the linewidth for kdeplot
+    use_numba : bool, optional
+        Evaluate kdes of small facets with a numba kernel, if numba is installed. Only faster for very small
+        facets, and the first call pays to import and compile numba
     **kwargs
         Other keyword arguments are passed through to sns.FacetGrid
 
@@ -63,14 +177,18 @@ def ridgeplot(data, x, hue, aspect=5, height=1, alpha=0.7, text_xpos=0, text_ypo
     >>> iris = sns.load_dataset('iris')
     >>> g = gpplot.ridgeplot(iris, 'sepal_width', 'species')
     """
+    sns = _lazy.seaborn()
     # Change background to be transparent and set style to white
     sns.set(style="white", rc={"axes.facecolor": (0, 0, 0, 0)})
     # Initialize a facetgrid
     g = sns.FacetGrid(data, row=hue, hue=hue, aspect=aspect, height=height, **kwargs)
     # Draw the densities in a few steps
-    g.map(sns.kdeplot, x, clip_on=False, shade=True, alpha=alpha, lw=lw)
-    # Label axes with the values from hue
-    g.map(label_axes, x, text_xpos=text_xpos, text_ypos=text_ypos, text_ha=text_ha, text_va=text_va)
+    g.map(ridge_kde, x, clip_on=False, alpha=alpha, lw=lw, use_numba=use_numba)
+    # Label axes with the values from hue, in axes coordinates, colored to match each hue's kde line
+    hue_colors = {line.get_label(): line.get_color() for ax in g.axes.flat for line in ax.lines}
+    for ax, label in zip(g.axes.flat, g.row_names):
+        ax.text(text_xpos, text_ypos, label, color=hue_colors.get(str(label), 'black'), ha=text_ha, va=text_va,
+                transform=ax.transAxes)
     # Set the subplots to overlap
     g.fig.subplots_adjust(hspace=-0.25)
     # Remove axes details that don't play well with overlap
@@ -81,7 +199,7 @@ def ridgeplot(data, x, hue, aspect=5, height=1, alpha=0.7, text_xpos=0, text_ypo
 
 
 def point_densityplot(data, x, y, bins=None, alpha=0.6, edgecolor=None, marker='o', rasterized=True, palette='viridis',
-                      legend=False, **kwargs):
+                      legend=False, ax=None, density_threshold=50000, raster_dpi=None, **kwargs):
     """Scatter plot with points colored by density
 
     Rasterized for easy illustrator import
@@ -94,8 +212,8 @@ def point_densityplot(data, x, y, bins=None, alpha=0.6, edgecolor=None, marker='
         Variable to plot on the x axis
     y: str
         Variable to plot on the y axis
-    bins: list of ints, optional
-        Binsize for density estimate. Defaults to [20, 20]
+    bins: int or list of ints, optional
+        Number of bins in x and y for density estimate. Defaults to [20, 20]
     alpha: float, optional
         Opacity of points
     edgecolor: str, optional
@@ -104,36 +222,87 @@ def point_densityplot(data, x, y, bins=None, alpha=0.6, edgecolor=None, marker='
         Point shape
     rasterized: bool, optional
         Whether to rasterize scatterplot
+    raster_dpi: int, optional
+        If rasterized, set the dpi of the axes' figure to this value, which is the resolution of the rasterized
+        points when the figure is saved with the default dpi. Axes and text stay as vectors. By default the
+        figure dpi is left unchanged
     palette: str, optional
         Color map
     legend: bool, optional
-        Whether to include legend for density
+        Whether to include a colorbar for density
+    ax: matplotlib.axes.Axes, optional
+        Plot to draw on, defaults to the current axes
+    density_threshold: int, optional
+        If data has more rows than this, draw the 2D histogram as a single image rather than
+        plotting individual points. The image ignores edgecolor, marker and **kwargs
     **kwargs
-        Additional aruments passed to scatterplot function
+        Additional aruments passed to matplotlib.axes.Axes.plot. A scalar marker area s, as taken by
+        scatter, is converted to markersize
 
     Returns
     -------
     matplotlib.axes.Axes
     """
-    # copy dataframe since we'll be manipulating it before plotting
-    df = data.copy()
-    x_val = df[x]
-    y_val = df[y]
+    plt = _lazy.pyplot()
+    if 's' in kwargs:
+        s = kwargs.pop('s')
+        if np.ndim(s) != 0:
+            raise TypeError("point_densityplot only supports a scalar marker size s")
+        kwargs['markersize'] = np.sqrt(s)
+    x_val = data[x].to_numpy()
+    y_val = data[y].to_numpy()
     if bins is None:
         bins = [20, 20]
-    hist_data, x_e, y_e = np.histogram2d(x_val, y_val, bins=bins, density=True)
-    z = interpn((0.5 * (x_e[1:] + x_e[:-1]), 0.5 * (y_e[1:] + y_e[:-1])), hist_data, np.vstack([x_val, y_val]).T,
-                method="splinef2d", bounds_error=False)
-    # Be sure to plot all data
-    z[np.where(np.isnan(z))] = 0.0
-    df['color'] = z
-    df = df.sort_values('color', ascending=True)
-    ax = sns.scatterplot(x=x, y=y, data=df, hue='color', alpha=alpha, edgecolor=edgecolor, marker=marker,
-                         rasterized=rasterized, palette=palette, legend=legend, **kwargs)
+    elif np.ndim(bins) == 0:
+        bins = [bins, bins]
+    hist_data, x_e, y_e, ix, iy = _histogram2d(x_val, y_val, bins)
+    if ax is None:
+        ax = plt.gca()
+    if rasterized and raster_dpi is not None:
+        ax.figure.set_dpi(raster_dpi)
+    if len(data) > density_threshold:
+        # Too many points to draw individually, so show empty bins as blank and color the rest by count
+        image = ax.imshow(np.ma.masked_equal(hist_data, 0).T, origin='lower',
+                          extent=[x_e[0], x_e[-1], y_e[0], y_e[-1]], cmap=palette, alpha=alpha, aspect='auto')
+        ax.set_xlabel(x)
+        ax.set_ylabel(y)
+        if legend:
+            plt.colorbar(image, ax=ax, label='density')
+        return ax
+    # Color each point by the count of its own bin
+    z = hist_data[ix, iy]
+    if len(z) == 0:
+        ax.set_xlabel(x)
+        ax.set_ylabel(y)
+        return ax
+    # Order points so the densest are drawn last, then quantize densities into color buckets so points can be
+    # drawn with one constant size marker line per bucket
+    order = np.argsort(z, kind='stable')
+    x_val = x_val[order]
+    y_val = y_val[order]
+    cmap = plt.get_cmap(palette)
+    norm = colors.Normalize(z.min(), z.max())
+    n_buckets = min(64, len(z))
+    buckets = np.minimum((norm(z[order]) * n_buckets).astype(int), n_buckets - 1)
+    splits = np.flatnonzero(np.diff(buckets)) + 1
+    for bucket, bucket_x, bucket_y in zip(buckets[np.r_[0, splits]], np.split(x_val, splits), np.split(y_val, splits)):
+        ax.plot(bucket_x, bucket_y, linestyle='', marker=marker, color=cmap(bucket / max(n_buckets - 1, 1)),
+                markeredgecolor=edgecolor, alpha=alpha, rasterized=rasterized, **kwargs)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    if legend:
+        plt.colorbar(cm.ScalarMappable(norm=norm, cmap=cmap), ax=ax, label='density')
     return ax
 
 
-def calculate_correlation(data, x, y, type):
+def _pearson_r(x, y):
+    """Pearson correlation coefficient between two 1D arrays"""
+    x = x - x.mean()
+    y = y - y.mean()
+    return (x @ y) / np.sqrt((x @ x) * (y @ y))
+
+
+def calculate_correlation(data, x, y, type, compute_pvalue=True):
     """
     Parameters
     ----------
@@ -145,19 +314,28 @@ def calculate_correlation(data, x, y, type):
         y variable to correlate
     type: str
         pearson or spearman
+    compute_pvalue: bool, optional
+        Whether to calculate significance. If False, only the correlation is calculated and significance is None
 
     Returns
     -------
      tuple:
         (correlation between x and y, significance)
     """
-    if type == 'spearman':
-        cor = stats.spearmanr(data[x], data[y])
-    elif type == 'pearson':
-        cor = stats.pearsonr(data[x], data[y])
-    else:
+    if type not in ('pearson', 'spearman'):
         raise ValueError("type must be 'pearson' or 'spearman'")
-    return cor
+    if compute_pvalue:
+        if type == 'spearman':
+            cor = stats.spearmanr(data[x], data[y])
+        else:
+            cor = stats.pearsonr(data[x], data[y])
+        return cor
+    x_val = data[x].to_numpy(dtype=float)
+    y_val = data[y].to_numpy(dtype=float)
+    if type == 'spearman':
+        x_val = stats.rankdata(x_val)
+        y_val = stats.rankdata(y_val)
+    return _pearson_r(x_val, y_val), None
 
 
 def add_correlation(data, x, y, method='pearson', signif=2, loc='upper left', fontfamily='Arial', ax=None, **kwargs):
@@ -190,7 +368,8 @@ def add_correlation(data, x, y, method='pearson', signif=2, loc='upper left', fo
     -------
     matplotlib.axes.Axes
     """
-    r = calculate_correlation(data, x, y, method)
+    plt = _lazy.pyplot()
+    r = calculate_correlation(data, x, y, method, compute_pvalue=False)
     label = 'r = ' + str(round(r[0], signif))
     text = AnchoredText(label, loc=loc, frameon=False, prop=dict(fontfamily=fontfamily, **kwargs))
     if ax is None:
@@ -242,7 +421,7 @@ def pandas_barplot(data, x, hue, y, x_order=None, hue_order=None, horizontal=Tru
 
 
 def density_rugplot(data, x, y, y_values, density_height=2, rug_height=1, density_color='black', rug_color='black',
-                    rug_alpha=0.5, figsize=plt.rcParams['figure.figsize'], ref_line=None, ref_line_color='black',
+                    rug_alpha=0.5, figsize=None, ref_line=None, ref_line_color='black', use_numba=False,
                     **kwargs):
     """Creates a density rugplot
 
@@ -270,11 +449,14 @@ def density_rugplot(data, x, y, y_values, density_height=2, rug_height=1, densit
     rug_alpha: float, optional
         Opacity of rug plot
     figsize: tuple, optional
-        Size of entire figure
+        Size of entire figure, defaults to matplotlib's figure.figsize
     ref_line: int, optional
         x value of reference line to include for all plots
     ref_line_color: str, optional
         Color of reference line
+    use_numba: bool, optional
+        Evaluate the density of small inputs with a numba kernel, if numba is installed. Only faster for very
+        small inputs, and the first call pays to import and compile numba
     **kwargs
         Other keyword arguments are passed through to sns.rugplot
 
@@ -285,26 +467,34 @@ def density_rugplot(data, x, y, y_values, density_height=2, rug_height=1, densit
     numpy.ndarray of matplotlib.axes.Axes
         individual subplots
     """
+    plt = _lazy.pyplot()
+    sns = _lazy.seaborn()
+    if figsize is None:
+        figsize = mpl.rcParams['figure.figsize']
     height_ratios = [density_height] + ([rug_height] * len(y_values))
     fig, ax = plt.subplots((len(y_values) + 1), 1, gridspec_kw={'height_ratios': height_ratios}, sharex=True,
                            figsize=figsize)
+    x_val = data[x].to_numpy()
     # KDE plot of all x
-    sns.kdeplot(data=data[x], color=density_color, legend=False, ax=ax[0])
-    lims = (data[x].min(), data[x].max())
-    ax[0].set_xlim(lims)
+    ax[0].plot(*_kde(x_val, use_numba=use_numba), color=density_color)
+    finite_x = x_val[np.isfinite(x_val)]
+    if len(finite_x) > 0:
+        ax[0].set_xlim(finite_x.min(), finite_x.max())
     ax[0].set_xticks([])
     ax[0].set_yticks([])
     ax[0].set_ylabel('All', rotation='horizontal', ha='right', va='center')
-    if ref_line is not None:
-        ax[0].axvline(x=ref_line, color=ref_line_color, linestyle='--')
     # Rugplots for each y value
+    groups = {value: group.to_numpy() for value, group in data.groupby(y)[x]}
     for i, value in enumerate(y_values):
-        sns.rugplot(a=data.loc[data[y] == value, x], height=1, ax=ax[i + 1], color=rug_color, alpha=rug_alpha, **kwargs)
+        sns.rugplot(a=groups.get(value, np.empty(0)), height=1, ax=ax[i + 1], color=rug_color, alpha=rug_alpha,
+                    **kwargs)
         ax[i + 1].set_ylabel(value, rotation='horizontal', ha='right', va='center')
         ax[i + 1].set_yticks([])
-        ax[i + 1].get_xaxis().set_major_locator(ticker.AutoLocator())
-        if ref_line is not None:
-            ax[i + 1].axvline(x=ref_line, color=ref_line_color, linestyle='--')
+    # x axes are shared, so restoring the locator on one axis restores it for all
+    ax[-1].get_xaxis().set_major_locator(ticker.AutoLocator())
+    if ref_line is not None:
+        for subplot in ax:
+            subplot.axvline(x=ref_line, color=ref_line_color, linestyle='--')
     plt.xlabel(x)
     return fig, ax
 
@@ -339,12 +529,13 @@ def label_points(data, x, y, label, label_col, arrowstyle='-', arrow_color='blac
     -------
     matplotlib.axes.Axes
     """
-    labelled_data = data[data[label_col].isin(label)]
+    plt = _lazy.pyplot()
+    adjust_text = _lazy.adjust_text()
+    labelled_data = data.loc[data[label_col].isin(label), [x, y, label_col]]
     if ax is None:
         ax = plt.gca()
-    texts = []
-    for i, row in labelled_data.iterrows():
-        texts.append(ax.text(row[x], row[y], row[label_col], **kwargs))
+    texts = [ax.text(x_pos, y_pos, text, **kwargs) for x_pos, y_pos, text in
+             zip(labelled_data[x].to_numpy(), labelled_data[y].to_numpy(), labelled_data[label_col].to_numpy())]
     # ensures text labels are non-overlapping
     adjust_text(texts, arrowprops=dict(arrowstyle=arrowstyle, color=arrow_color, lw=arrow_lw))
     return ax
@@ -379,6 +570,7 @@ def dark_boxplot(data, x, y, boxprops=None, medianprops=None, whiskerprops=None,
     -------
     matplotlib.axes.Axes
     """
+    sns = _lazy.seaborn()
     if boxprops is None:
         boxprops = {'edgecolor': 'black'}
     if medianprops is None:
@@ -418,6 +610,8 @@ def add_reg_line(data, x, y, ax=None, linestyle='dashed', linecolor='black', **k
     -------
     matplotlib.axes.Axes
     """
+    plt = _lazy.pyplot()
+    sns = _lazy.seaborn()
     if ax is None:
         ax = plt.gca()
     ax = sns.regplot(data=data, x=x, y=y, scatter=False, ax=ax,
@@ -445,6 +639,7 @@ def add_xy_line(slope=1, intercept=0, ax=None, linestyle='dashed', linecolor='bl
     -------
     matplotlib.axes.Axes
     """
+    plt = _lazy.pyplot()
     if ax is None:
         ax = plt.gca()
     x = np.array(ax.get_xlim())
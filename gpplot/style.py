@@ -1,12 +1,23 @@
 """style module. Contains functions to standardize styles for matplotlib-based plots"""
 
-import seaborn as sns
+from functools import lru_cache
+
 import matplotlib as mpl
-import matplotlib.pyplot as plt
+
+from . import _lazy
+
+
+@lru_cache(maxsize=16)
+def _named_palette_colors(palette, n):
+    """RGB colors of a named seaborn palette, cached as an immutable tuple"""
+    return tuple(_lazy.seaborn().color_palette(palette, n))
 
 
 def discrete_palette(palette='Set2', n=8):
     """Default discrete palette"""
+    sns = _lazy.seaborn()
+    if isinstance(palette, str):
+        return sns.color_palette(_named_palette_colors(palette, n))
     return sns.color_palette(palette, n)
 
 
@@ -39,6 +50,7 @@ def set_aesthetics(style='ticks', context='notebook', font='Arial',
     rc: dict, optional
         Mappings to pass to matplotlib.rcParams
     """
+    sns = _lazy.seaborn()
     if palette is None:
         palette = discrete_palette()
     sns.set(style=style, context=context, font=font,
@@ -46,8 +58,7 @@ def set_aesthetics(style='ticks', context='notebook', font='Arial',
             font_scale=font_scale)
     mpl.rc('pdf', fonttype=42)
     if rc is not None:
-        for key, value in rc:
-            mpl.rcParams[key] = value
+        mpl.rcParams.update(rc)
 
 
 def savefig(path, fig=None, bbox_inches='tight', transparent=True, **kwargs):
@@ -67,5 +78,5 @@ def savefig(path, fig=None, bbox_inches='tight', transparent=True, **kwargs):
         Other keyword arguments are passed through to matplotlib.pyplot.savefig
     """
     if fig is None:
-        fig = plt.gcf()
+        fig = _lazy.pyplot().gcf()
     fig.savefig(path, bbox_inches=bbox_inches, transparent=transparent, **kwargs)
@@ -32,6 +32,7 @@ setup(
     ],
     description="Plotting functions for the Genetic Perturbation Platform's R&D group at the Broad institute.",
     install_requires=requirements,
+    extras_require={'numba': ['numba>=0.50']},
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
@@ -2,12 +2,15 @@
 
 """Tests for `gpplot` package."""
 
+import warnings
+
 import pytest
 
 import gpplot
 import seaborn as sns
 import pandas as pd
 import numpy as np
+import matplotlib.pyplot as plt
 
 
 @pytest.fixture
@@ -19,14 +22,103 @@ def scatter_data():
     return data
 
 
-def test_ridgeplot():
-    iris = sns.load_dataset('iris')
+@pytest.fixture(scope='session')
+def iris():
+    return sns.load_dataset('iris')
+
+
+@pytest.fixture(scope='session')
+def mpg():
+    return sns.load_dataset('mpg')
+
+
+@pytest.fixture(scope='session')
+def tips():
+    return sns.load_dataset('tips')
+
+
+def test_ridgeplot(iris):
     g = gpplot.ridgeplot(iris, 'sepal_width', 'species')
     assert g.row_names == ['setosa', 'versicolor', 'virginica']
 
 
+def test_ridgeplot_row_order(scatter_data):
+    data = scatter_data.assign(group=np.repeat(['a', 'b', 'c'], [500, 500, 1000]))
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', UserWarning)
+        g = gpplot.ridgeplot(data, 'x', 'group', row_order=['c', 'b', 'a'])
+    for ax, label in zip(g.axes.flat, ['c', 'b', 'a']):
+        assert ax.texts[0].get_text() == label
+        assert ax.texts[0].get_color() == ax.lines[0].get_color()
+        assert ax.lines[0].get_label() == label
+
+
 def test_point_density_plot(scatter_data):
+    plt.figure()
+    ax = gpplot.point_densityplot(scatter_data, 'x', 'y')
+    assert 0 < len(ax.lines) <= 64
+    assert sum(len(line.get_xdata()) for line in ax.lines) == len(scatter_data)
+
+
+def test_histogram2d(scatter_data):
+    x_val = scatter_data['x'].to_numpy()
+    y_val = scatter_data['y'].to_numpy()
+    hist, x_e, y_e, ix, iy = gpplot.plots._histogram2d(x_val, y_val, [20, 10])
+    np_hist, np_x_e, np_y_e = np.histogram2d(x_val, y_val, bins=[20, 10])
+    np.testing.assert_array_equal(hist, np_hist)
+    np.testing.assert_allclose(x_e, np_x_e)
+    np.testing.assert_allclose(y_e, np_y_e)
+    np.testing.assert_array_equal(hist[ix, iy] > 0, True)
+    empty_hist, empty_x_e, _, _, _ = gpplot.plots._histogram2d(np.empty(0), np.empty(0), [20, 10])
+    np_empty_hist, np_empty_x_e, _ = np.histogram2d(np.empty(0), np.empty(0), bins=[20, 10])
+    np.testing.assert_array_equal(empty_hist, np_empty_hist)
+    np.testing.assert_allclose(empty_x_e, np_empty_x_e)
+    x_val = x_val.copy()
+    x_val[0] = np.nan
+    with pytest.raises(ValueError):
+        np.histogram2d(x_val, y_val, bins=[20, 10])
+    with pytest.raises(ValueError):
+        gpplot.plots._histogram2d(x_val, y_val, [20, 10])
+
+
+def test_point_density_plot_empty():
+    plt.figure()
+    ax = gpplot.point_densityplot(pd.DataFrame({'x': [], 'y': []}), 'x', 'y')
+    assert len(ax.lines) == 0
+
+
+def test_point_density_plot_raster_dpi(scatter_data):
+    plt.figure()
+    ax = gpplot.point_densityplot(scatter_data, 'x', 'y', raster_dpi=200)
+    assert ax.figure.get_dpi() == 200
+    fig = plt.figure(dpi=300)
     ax = gpplot.point_densityplot(scatter_data, 'x', 'y')
+    assert fig.get_dpi() == 300
+    assert ax.lines[-1].get_rasterized()
+
+
+def test_point_density_plot_ax(scatter_data):
+    fig, axes = plt.subplots(1, 2)
+    ax = gpplot.point_densityplot(scatter_data, 'x', 'y', ax=axes[0])
+    assert ax is axes[0]
+    assert len(axes[0].lines) > 0
+    assert len(axes[1].lines) == 0
+
+
+def test_point_density_plot_marker_size(scatter_data):
+    plt.figure()
+    ax = gpplot.point_densityplot(scatter_data, 'x', 'y', s=25)
+    assert ax.lines[0].get_markersize() == 5
+    with pytest.raises(TypeError):
+        gpplot.point_densityplot(scatter_data, 'x', 'y', s=np.ones(len(scatter_data)))
+
+
+def test_point_density_plot_image(scatter_data):
+    plt.figure()
+    ax = gpplot.point_densityplot(scatter_data, 'x', 'y', density_threshold=1000, legend=True)
+    assert len(ax.images) == 1
+    assert len(ax.lines) == 0
+    assert len(ax.figure.axes) == 2
 
 
 def test_correlation(scatter_data):
@@ -35,6 +127,11 @@ def test_correlation(scatter_data):
     spearman = gpplot.plots.calculate_correlation(scatter_data, 'x', 'y', 'spearman')
     assert spearman[1] < 0.01
     assert pearson[0] != spearman[0]
+    pearson_r, pearson_p = gpplot.plots.calculate_correlation(scatter_data, 'x', 'y', 'pearson', compute_pvalue=False)
+    assert pearson_r == pytest.approx(pearson[0])
+    assert pearson_p is None
+    spearman_r, _ = gpplot.plots.calculate_correlation(scatter_data, 'x', 'y', 'spearman', compute_pvalue=False)
+    assert spearman_r == pytest.approx(spearman[0])
 
 
 def test_add_correlation(scatter_data):
@@ -42,26 +139,22 @@ def test_add_correlation(scatter_data):
     ax = gpplot.add_correlation(scatter_data, 'x', 'y', size=12, color='blue')
 
 
-def test_barplot():
-    mpg = sns.load_dataset('mpg')
+def test_barplot(mpg):
     mpg_summary = (mpg.groupby(['model_year', 'origin']).agg({'mpg': 'mean'}).reset_index())
     ax = gpplot.pandas_barplot(mpg_summary, 'model_year', 'origin', 'mpg')
 
 
-def test_density_rugplot():
-    data = sns.load_dataset('iris')
-    fig, ax = gpplot.density_rugplot(data, 'petal_length', 'species', ['setosa', 'virginica'])
+def test_density_rugplot(iris):
+    fig, ax = gpplot.density_rugplot(iris, 'petal_length', 'species', ['setosa', 'virginica'])
 
 
-def test_label_points():
-    mpg = sns.load_dataset('mpg')
+def test_label_points(mpg):
     ax = sns.scatterplot(data=mpg, x='weight', y='mpg')
     label = ['hi 1200d', 'ford f250', 'chevy c20', 'oldsmobile omega']
     gpplot.label_points(mpg, 'weight', 'mpg', label, 'name')
 
 
-def test_dark_boxplot():
-    tips = sns.load_dataset("tips")
+def test_dark_boxplot(tips):
     ax = gpplot.dark_boxplot(data=tips, x="size", y="total_bill")
 
 
@@ -73,3 +166,40 @@ def test_add_regline(scatter_data):
 def test_add_xyline(scatter_data):
     ax = gpplot.point_densityplot(scatter_data, 'x', 'y')
     ax = gpplot.add_xy_line()
+
+
+def test_discrete_palette():
+    palette = gpplot.discrete_palette()
+    assert len(palette) == 8
+    assert gpplot.discrete_palette() == palette
+    assert gpplot.discrete_palette() is not palette
+    assert gpplot.discrete_palette(['red', 'blue'], 2).as_hex() == ['#ff0000', '#0000ff']
+
+
+def test_fft_kde(scatter_data):
+    grid, density = gpplot.plots._fft_kde(scatter_data['x'])
+    assert density.sum() * (grid[1] - grid[0]) == pytest.approx(1)
+
+
+def test_kde_no_finite_samples():
+    grid, density = gpplot.plots._kde(np.array([np.nan, np.inf]))
+    assert len(grid) == 0
+    assert len(density) == 0
+
+
+def test_kde(scatter_data):
+    grid, density = gpplot.plots._kde(scatter_data['x'])
+    fft_grid, fft_density = gpplot.plots._fft_kde(scatter_data['x'])
+    np.testing.assert_allclose(grid, fft_grid)
+    np.testing.assert_allclose(density, fft_density, atol=1e-3)
+    assert gpplot.plots._kde(scatter_data['x'].copy())[1] is density
+    small = scatter_data['x'].to_numpy()[:10]
+    numba_grid, numba_density = gpplot.plots._kde(small, grid_n=64, use_numba=True)
+    np.testing.assert_allclose(numba_density, gpplot.plots._fft_kde(small, grid_n=64)[1], atol=1e-2)
+
+
+def test_set_aesthetics():
+    with plt.rc_context():
+        gpplot.set_aesthetics(rc={'figure.dpi': 123, 'lines.linewidth': 3})
+        assert plt.rcParams['figure.dpi'] == 123
+        assert plt.rcParams['lines.linewidth'] == 3